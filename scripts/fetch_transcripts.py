@@ -15,12 +15,34 @@ import json
 import logging
 import os
 import re
+import signal
 import subprocess
 import sys
-import time
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+from itertools import zip_longest
 
 import gspread
-from oauth2client.service_account import ServiceAccountCredentials
+from diskcache import Cache
+from requests.adapters import HTTPAdapter
+from google.oauth2.service_account import Credentials
+from gspread.utils import rowcol_to_a1
+from youtube_transcript_api import (
+    NoTranscriptFound,
+    TranscriptsDisabled,
+    VideoUnavailable,
+    YouTubeTranscriptApi,
+)
+
+# orjson parses large JSON payloads several times faster than stdlib json;
+# fall back silently when it isn't installed (e.g. ad-hoc local runs).
+try:
+    import orjson
+
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
 
 logging.basicConfig(
     level=logging.INFO,
@@ -30,17 +52,60 @@ log = logging.getLogger(__name__)
 
 MAX_ROWS_PER_RUN = 50
 MAX_RETRIES = 3
+MAX_TRANSCRIPT_CHARS = 49000  # stay under the 50000-char Sheets cell limit
 WORKSHEET_NAME = "Ingest_Queue"
-
-
+FLUSH_EVERY = 25  # rows between batch_update flushes (bounds payload size)
+# Concurrent fetches; useful ceiling is YouTube's per-IP limit, not Python
+MAX_WORKERS = int(os.environ.get("MAX_WORKERS", "8"))
+# Comma-separated subtitle languages; set SUB_LANGS=en,en-US,en-orig,ko,ko-KR
+# to re-enable Korean tracks. Every extra language costs HTTP calls per video.
+SUB_LANGS = os.environ.get("SUB_LANGS", "en,en-US,en-orig")
+TRANSCRIPT_LANGS = SUB_LANGS.split(",")
+CACHE_DIR = ".cache/transcripts"
+CACHE_TTL = 7 * 86400  # seconds; cached transcripts expire after a week
+
+_transcript_cache = Cache(CACHE_DIR)
+
+# One working directory for all yt-dlp output this run; each fetch writes
+# files namespaced by its video ID, so worker threads never collide and
+# there is no per-call mkdir/rmtree churn. Cleaned up at interpreter exit.
+_ytdlp_workdir = tempfile.TemporaryDirectory(prefix="yt_subs_")
+
+# Lines to drop from subtitle files: cue timings, the WEBVTT header,
+# styling tags, and bare cue numbers.
+_VTT_SKIP = re.compile(r"-->|WEBVTT|<c>|^\d+\s*$")
+
+# Statuses that mean a row has never been fetched successfully. Failed
+# rows are matched by prefix instead, since they carry retry suffixes.
+PENDING_STATUSES = frozenset({"Pending", "Pending Transcript"})
+
+# Status prefix and retry-count suffix for failed rows, e.g.
+# "Transcript Failed x2".
+_FAILED_PREFIX = "Transcript Failed"
+_RETRY_RE = re.compile(r"x(\d+)$")
+
+# yt-dlp stderr patterns that mean the video will never yield a
+# transcript, paired with the reason written to the sheet.
+_PERM_ERRORS = [
+    (re.compile(r"Sign in|age[- ]restricted", re.I), "Age Restricted / Sign-in Required"),
+    (re.compile(r"Video unavailable", re.I), "Video Deleted or Private"),
+    (re.compile(r"Private video", re.I), "Video is Private"),
+]
+
+
+@lru_cache(maxsize=1)
 def get_gspread_client():
-    """Authenticate with Google Sheets using service-account credentials."""
+    """Authenticate with Google Sheets using service-account credentials.
+
+    Cached so repeat callers share one client (and its OAuth token
+    exchange plus connection pool) instead of re-authorizing.
+    """
     creds_json = os.environ.get("GOOGLE_CREDENTIALS")
     if not creds_json:
         sys.exit("GOOGLE_CREDENTIALS environment variable is not set")
 
     try:
-        creds_dict = json.loads(creds_json)
+        creds_dict = _json_loads(creds_json)
         log.info(
             "Credentials loaded. Project: %s, Email: %s",
             creds_dict.get("project_id"),
@@ -50,12 +115,22 @@ def get_gspread_client():
         log.error("Failed to parse GOOGLE_CREDENTIALS JSON: %s", e)
         sys.exit(1)
 
-    scope = [
-        "https://spreadsheets.google.com/feeds",
+    scopes = [
+        "https://www.googleapis.com/auth/spreadsheets",
         "https://www.googleapis.com/auth/drive",
     ]
-    credentials = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, scope)
-    return gspread.authorize(credentials)
+    credentials = Credentials.from_service_account_info(creds_dict, scopes=scopes)
+    # BackOffHTTPClient retries rate-limited (429) and 5xx responses with
+    # exponential backoff, so a quota burst doesn't throw away transcripts
+    # that were already fetched.
+    client = gspread.authorize(credentials, http_client=gspread.BackOffHTTPClient)
+    # Deepen the connection pool so interleaved reads/writes reuse keep-alive
+    # connections instead of re-handshaking TLS. requests already asks for
+    # gzip, which matters for the multi-MB column reads.
+    client.http_client.session.mount(
+        "https://", HTTPAdapter(pool_connections=4, pool_maxsize=8)
+    )
+    return client
 
 
 def open_sheet(client):
@@ -69,95 +144,149 @@ def open_sheet(client):
 
 
 def fetch_transcript(video_id):
-    """Use yt-dlp to download the transcript for a YouTube video.
+    """Fetch a transcript, serving repeat requests from the disk cache.
+
+    "OK" and "PERMANENT" results are cached (with a 7-day TTL) — a
+    deleted or age-restricted video stays that way, so there is no point
+    re-probing it every run. Transient "FAILED" results are never cached,
+    so retry rows still hit the network. Cache hits on re-runs — common
+    in CI after a partial sheet update — return in microseconds with zero
+    YouTube traffic.
+    """
+    cached = _transcript_cache.get(video_id)
+    if cached is not None:
+        log.info("%s: transcript cache hit (%s)", video_id, cached[0])
+        return cached
+
+    result = _fetch_transcript_uncached(video_id)
+    if result[0] in ("OK", "PERMANENT"):
+        _transcript_cache.set(video_id, result, expire=CACHE_TTL, tag="transcript")
+    return result
+
+
+def _fetch_transcript_uncached(video_id):
+    """Fetch the transcript for a YouTube video.
+
+    Tries the in-process youtube-transcript-api first (hits YouTube's
+    timedtext endpoint directly: no subprocess fork, no disk I/O, no VTT
+    parsing), then falls back to yt-dlp for videos the API chokes on.
 
     Returns (status, text, lang):
       - ("OK", transcript_text, "en")   on success
       - ("FAILED", reason, "xx")        on failure
       - ("PERMANENT", reason, "xx")     on permanent failure (don't retry)
     """
+    try:
+        transcripts = YouTubeTranscriptApi().list(video_id)
+        transcript = transcripts.find_transcript(TRANSCRIPT_LANGS)
+        # Consume the segments inside the try: a surprise shape or error
+        # here must also fall through to the yt-dlp fallback below.
+        text = " ".join(snippet.text for snippet in transcript.fetch())
+    except TranscriptsDisabled:
+        return "PERMANENT", "Transcripts disabled for this video", "xx"
+    except VideoUnavailable:
+        return "PERMANENT", "Video Deleted or Private", "xx"
+    except NoTranscriptFound:
+        return "FAILED", "No transcript in supported languages", "xx"
+    except Exception as e:
+        # IP blocks and transient HTTP errors land here — let yt-dlp try.
+        log.warning("%s: transcript API failed (%s) — falling back to yt-dlp", video_id, e)
+        return _fetch_transcript_ytdlp(video_id)
+
+    if len(text) > 50:
+        return "OK", text[:MAX_TRANSCRIPT_CHARS], transcript.language_code
+    return "FAILED", "No transcript data found", "xx"
+
+
+def _fetch_transcript_ytdlp(video_id):
+    """Download the transcript with a yt-dlp subprocess (fallback path)."""
     url = f"https://www.youtube.com/watch?v={video_id}"
+    out_prefix = os.path.join(_ytdlp_workdir.name, video_id)
 
     cmd = [
         "yt-dlp",
         "--no-warnings",
         "--skip-download",
         "--write-auto-sub",
-        "--write-sub",
-        "--sub-lang", "en,en-US,en-orig,ko,ko-KR",
-        "--output", f"temp_{video_id}",
+        "--sub-langs", SUB_LANGS,
+        "--sub-format", "vtt",
+        "--output", out_prefix,
         "--no-check-certificate",
         url,
     ]
 
     try:
-        result = subprocess.run(
+        # Run yt-dlp in its own session: a plain timeout kill only reaches
+        # the direct child, and any helper processes it spawned would keep
+        # eating bandwidth for the rest of the run.
+        proc = subprocess.Popen(
             cmd,
-            capture_output=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
             text=True,
-            timeout=45,
+            start_new_session=True,
         )
+        try:
+            _, stderr_text = proc.communicate(timeout=45)
+        except subprocess.TimeoutExpired:
+            os.killpg(proc.pid, signal.SIGKILL)
+            proc.wait()
+            return "FAILED", "yt-dlp timed out after 45s", "xx"
 
-        if result.returncode != 0:
-            stderr = result.stderr.strip()
-            log.warning("yt-dlp exit code %d for %s: %s", result.returncode, video_id, stderr[:200])
+        if proc.returncode != 0:
+            log.warning("yt-dlp exit code %d for %s: %s", proc.returncode, video_id, stderr_text.strip()[:200])
 
         found_text = ""
         lang_found = "xx"
 
-        for filename in os.listdir("."):
-            if filename.startswith(f"temp_{video_id}") and (
-                filename.endswith(".vtt")
-                or filename.endswith(".srv3")
-                or filename.endswith(".ttml")
-            ):
-                with open(filename, "r", encoding="utf-8", errors="ignore") as f:
-                    content = f.read()
-                    lines = []
-                    for line in content.splitlines():
-                        stripped = line.strip()
-                        if (
-                            stripped
-                            and "-->" not in line
-                            and "WEBVTT" not in line
-                            and "<c>" not in line
-                            and not stripped.isdigit()
-                        ):
-                            lines.append(stripped.replace("&nbsp;", " "))
-                    found_text = " ".join(lines)
-                    lang_found = filename.split(".")[-2]
-
-                os.remove(filename)
-                break
-
-        # Clean up any other temp files
-        for filename in os.listdir("."):
-            if filename.startswith(f"temp_{video_id}"):
-                try:
-                    os.remove(filename)
-                except OSError:
-                    pass
+        # yt-dlp's output name is deterministic — <prefix>.<lang>.vtt for
+        # whichever requested track existed — so probe those directly
+        # rather than scanning the directory.
+        for lang in TRANSCRIPT_LANGS:
+            filepath = f"{out_prefix}.{lang}.vtt"
+            if not os.path.exists(filepath):
+                continue
+            with open(filepath, "r", encoding="utf-8", errors="ignore") as f:
+                # Auto-generated captions repeat each phrase across
+                # overlapping cues, so drop consecutive duplicates —
+                # otherwise the char cap truncates real content.
+                lines = []
+                total_len = 0
+                for line in f:
+                    stripped = line.strip()
+                    if stripped and not _VTT_SKIP.search(line):
+                        caption = stripped.replace("&nbsp;", " ")
+                        if not lines or lines[-1] != caption:
+                            lines.append(caption)
+                            total_len += len(caption) + 1
+                            # Everything past the cell cap gets sliced off
+                            # anyway; stop reading once we're there.
+                            if total_len >= MAX_TRANSCRIPT_CHARS:
+                                break
+                found_text = " ".join(lines)
+                lang_found = lang
+            break
 
         if len(found_text) > 50:
-            return "OK", found_text[:49000], lang_found
+            return "OK", found_text[:MAX_TRANSCRIPT_CHARS], lang_found
 
         # Classify the failure
-        if result.returncode != 0:
-            stderr_text = result.stderr
-            if "Sign in" in stderr_text:
-                return "PERMANENT", "Age Restricted / Sign-in Required", "xx"
-            if "Video unavailable" in stderr_text:
-                return "PERMANENT", "Video Deleted or Private", "xx"
-            if "Private video" in stderr_text:
-                return "PERMANENT", "Video is Private", "xx"
-            return "FAILED", f"yt-dlp error: {result.stderr.strip()[:100]}", "xx"
+        if proc.returncode != 0:
+            for pattern, reason in _PERM_ERRORS:
+                if pattern.search(stderr_text):
+                    return "PERMANENT", reason, "xx"
+            return "FAILED", f"yt-dlp error: {stderr_text.strip()[:100]}", "xx"
 
         return "FAILED", "No transcript data found", "xx"
 
-    except subprocess.TimeoutExpired:
-        return "FAILED", "yt-dlp timed out after 45s", "xx"
     except Exception as e:
         return "FAILED", str(e), "xx"
+    finally:
+        for lang in TRANSCRIPT_LANGS:
+            try:
+                os.remove(f"{out_prefix}.{lang}.vtt")
+            except OSError:
+                pass
 
 
 def parse_retry_count(status):
@@ -167,16 +296,13 @@ def parse_retry_count(status):
     'Transcript Failed x2' -> 2
     'Transcript Failed x3' -> 3
     """
-    match = re.search(r"x(\d+)$", status)
-    if match:
-        return int(match.group(1))
-    return 1
+    match = _RETRY_RE.search(status)
+    return int(match.group(1)) if match else 1
 
 
 def process_rows(worksheet):
     """Process rows in priority order: Pending first, then retries."""
-    rows = worksheet.get_all_values()
-    headers = rows[0]
+    headers = worksheet.row_values(1)
 
     try:
         id_col = headers.index("Video ID")
@@ -185,95 +311,139 @@ def process_rows(worksheet):
     except ValueError as exc:
         sys.exit(f"Required column not found in sheet headers: {exc}")
 
-    log.info("Found %d rows (including header). Scanning...", len(rows))
+    # Only the ID and Status columns are consulted during the scan — the
+    # Transcript column alone can hold 49000 chars per row, so skipping it
+    # shrinks the initial read by orders of magnitude on a full sheet.
+    id_letter = rowcol_to_a1(1, id_col + 1)[:-1]
+    status_letter = rowcol_to_a1(1, status_col + 1)[:-1]
+    id_vals, status_vals = worksheet.batch_get(
+        [f"{id_letter}2:{id_letter}", f"{status_letter}2:{status_letter}"],
+        major_dimension="COLUMNS",
+    )
+    video_ids = id_vals[0] if id_vals else []
+    statuses = status_vals[0] if status_vals else []
+    n_rows = max(len(video_ids), len(statuses))
+
+    log.info("Found %d data rows. Scanning...", n_rows)
 
-    # Categorize rows into priority buckets
+    # Categorize rows into priority buckets, tallying statuses in the same
+    # pass so the sheet is only scanned once.
     pending_rows = []       # Priority 1: never tried
     retry_rows = []         # Priority 2: failed but retryable
     skip_count = 0
+    status_counts = {}
 
-    for i in range(1, len(rows)):
-        row = rows[i]
-        if len(row) <= status_col:
-            continue
+    # The two column vectors may end at different rows (Sheets trims
+    # trailing blanks), so pad the shorter one.
+    for row_num, (video_id, status) in enumerate(
+        zip_longest(video_ids, statuses, fillvalue=""), start=2
+    ):
+        video_id = video_id.strip()
+        status = status.strip()
 
-        video_id = row[id_col].strip()
-        status = row[status_col].strip()
-        row_num = i + 1
+        status_counts[status] = status_counts.get(status, 0) + 1
 
         if not video_id:
             continue
 
-        if status == "Pending" or status == "Pending Transcript":
-            pending_rows.append((row_num, video_id, status))
+        # The buckets are capped at the per-run budget: rows past the cap
+        # can never be processed this run, so don't materialize them.
+        if status in PENDING_STATUSES:
+            if len(pending_rows) < MAX_ROWS_PER_RUN:
+                pending_rows.append((row_num, video_id, status))
 
-        elif status.startswith("Transcript Failed"):
+        elif status.startswith(_FAILED_PREFIX):
             retries = parse_retry_count(status)
             if retries >= MAX_RETRIES:
                 skip_count += 1
-            else:
+            elif len(retry_rows) < MAX_ROWS_PER_RUN:
                 retry_rows.append((row_num, video_id, status, retries))
 
-    # Log the breakdown
-    status_counts = {}
-    for row in rows[1:]:
-        if len(row) > status_col:
-            s = row[status_col].strip()
-            status_counts[s] = status_counts.get(s, 0) + 1
     log.info("Status counts: %s", json.dumps(status_counts, indent=2))
     log.info(
         "Work queue: %d Pending, %d retryable failures, %d maxed-out (skipped)",
         len(pending_rows), len(retry_rows), skip_count,
     )
 
-    processed = 0
-
-    # --- PASS 1: Process "Pending" rows (new videos) ---
-    for row_num, video_id, status in pending_rows:
-        if processed >= MAX_ROWS_PER_RUN:
-            break
-
-        log.info("Row %d (%s): NEW — fetching transcript...", row_num, video_id)
-        processed += _process_one_row(
-            worksheet, row_num, video_id, transcript_col, status_col, retry_count=0,
+    # Build the work list up front: Pending rows first, then retries if
+    # budget remains. Each entry is (row_num, video_id, retry_count).
+    work = [
+        (row_num, video_id, 0)
+        for row_num, video_id, status in pending_rows[:MAX_ROWS_PER_RUN]
+    ]
+    remaining = MAX_ROWS_PER_RUN - len(work)
+    if remaining > 0 and retry_rows:
+        log.info("Budget remaining: %d slots. Retrying %d failed rows...", remaining, min(remaining, len(retry_rows)))
+        work.extend(
+            (row_num, video_id, retries)
+            for row_num, video_id, status, retries in retry_rows[:remaining]
         )
-        time.sleep(3)
 
-    # --- PASS 2: Retry "Transcript Failed" rows (if budget remains) ---
-    if processed < MAX_ROWS_PER_RUN and retry_rows:
-        remaining = MAX_ROWS_PER_RUN - processed
-        log.info("Budget remaining: %d slots. Retrying %d failed rows...", remaining, min(remaining, len(retry_rows)))
+    processed = 0
+    pending_writes = []
+
+    # The same video can appear in several rows (re-adds, duplicate
+    # imports) — fetch each unique ID once and fan the result out.
+    unique = {}
+    for row_num, video_id, retries in work:
+        unique.setdefault(video_id, []).append((row_num, retries))
+    if len(unique) < len(work):
+        log.info("Deduplicated %d rows down to %d unique videos.", len(work), len(unique))
+
+    # The fetches are I/O-bound (yt-dlp waiting on YouTube), so run them
+    # concurrently and handle results as they land.
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = {
+            executor.submit(fetch_transcript, video_id): video_id
+            for video_id in unique
+        }
+        for future in as_completed(futures):
+            video_id = futures[future]
+            for row_num, retries in unique[video_id]:
+                processed += _process_one_row(
+                    future, row_num, video_id, transcript_col, status_col,
+                    pending_writes, retry_count=retries,
+                )
+            if len(pending_writes) >= 2 * FLUSH_EVERY:
+                _flush_writes(worksheet, pending_writes)
+
+    _flush_writes(worksheet, pending_writes)
+    log.info("Done. Processed %d rows total.", processed)
 
-        for row_num, video_id, status, retries in retry_rows:
-            if processed >= MAX_ROWS_PER_RUN:
-                break
 
-            log.info("Row %d (%s): RETRY #%d — fetching transcript...", row_num, video_id, retries + 1)
-            processed += _process_one_row(
-                worksheet, row_num, video_id, transcript_col, status_col, retry_count=retries,
-            )
-            time.sleep(3)
+def _flush_writes(worksheet, pending_writes):
+    """Send queued cell updates in one batch_update call and clear the queue."""
+    if not pending_writes:
+        return
+    worksheet.batch_update(pending_writes, value_input_option="RAW")
+    log.info("Flushed %d cell updates to the sheet.", len(pending_writes))
+    pending_writes.clear()
 
-    log.info("Done. Processed %d rows total.", processed)
+
+def _queue_write(pending_writes, row_num, col, value):
+    """Queue a single-cell update for the next batch_update flush."""
+    pending_writes.append(
+        {"range": rowcol_to_a1(row_num, col), "values": [[value]]}
+    )
 
 
-def _process_one_row(worksheet, row_num, video_id, transcript_col, status_col, retry_count):
-    """Fetch transcript for one video and update the sheet. Returns 1."""
+def _process_one_row(future, row_num, video_id, transcript_col, status_col, pending_writes, retry_count):
+    """Collect one finished fetch and queue the sheet updates. Returns 1."""
     try:
-        code, text, lang = fetch_transcript(video_id)
+        code, text, lang = future.result()
     except Exception:
-        log.exception("Row %d: unexpected error", row_num)
+        log.exception("Row %d (%s): unexpected error", row_num, video_id)
         code, text, lang = "FAILED", "Unexpected Python exception", "xx"
 
     if code == "OK":
         log.info("Row %d: SUCCESS (%s, %d chars)", row_num, lang, len(text))
-        worksheet.update_cell(row_num, transcript_col + 1, text)
-        worksheet.update_cell(row_num, status_col + 1, f"Ready for AI ({lang})")
+        _queue_write(pending_writes, row_num, transcript_col + 1, text)
+        _queue_write(pending_writes, row_num, status_col + 1, f"Ready for AI ({lang})")
 
     elif code == "PERMANENT":
         log.warning("Row %d: PERMANENT failure — %s", row_num, text)
-        worksheet.update_cell(row_num, status_col + 1, "Permanently Failed")
-        worksheet.update_cell(row_num, transcript_col + 1, text)
+        _queue_write(pending_writes, row_num, status_col + 1, "Permanently Failed")
+        _queue_write(pending_writes, row_num, transcript_col + 1, text)
 
     else:
         new_count = retry_count + 1
@@ -281,13 +451,13 @@ def _process_one_row(worksheet, row_num, video_id, transcript_col, status_col, r
             new_status = "Permanently Failed"
             log.warning("Row %d: FAILED x%d (max retries reached) — %s", row_num, new_count, text[:100])
         elif new_count == 1:
-            new_status = "Transcript Failed"
+            new_status = _FAILED_PREFIX
             log.warning("Row %d: FAILED — %s", row_num, text[:100])
         else:
-            new_status = f"Transcript Failed x{new_count}"
+            new_status = f"{_FAILED_PREFIX} x{new_count}"
             log.warning("Row %d: FAILED x%d — %s", row_num, new_count, text[:100])
 
-        worksheet.update_cell(row_num, status_col + 1, new_status)
+        _queue_write(pending_writes, row_num, status_col + 1, new_status)
 
     return 1
 